@@ -1,729 +1,1027 @@
-from datetime import datetime, timezone
-import inspect
-import os
-from pathlib import Path
-import cv2
-import numpy as np
-import datajoint as dj
-import importlib
-
-from element_interface.utils import find_full_path
-from .readers.kpms_reader import generate_kpms_dj_config, load_kpms_dj_config
-
-from . import moseq_infer
-
-schema = dj.schema()
-
-_linking_module = None
-
-
-def activate(
-    train_schema_name: str,
-    infer_schema_name: str = None,
-    *,
-    create_schema: bool = True,
-    create_tables: bool = True,
-    linking_module: str = None,
-):
-    """Activate this schema.
-
-    Args:
-        train_schema_name (str): A string containing the name of the `moseq_train` schema.
-        infer_schema_name (str): A string containing the name of the `moseq_infer` schema.
-        create_schema (bool): If True (default), schema  will be created in the database.
-        create_tables (bool): If True (default), tables related to the schema will be created in the database.
-        linking_module (str): A string containing the module name or module containing the required dependencies to activate the schema.
-
-    """
-
-    if isinstance(linking_module, str):
-        linking_module = importlib.import_module(linking_module)
-    assert inspect.ismodule(
-        linking_module
-    ), "The argument 'dependency' must be a module's name or a module"
-
-    assert hasattr(
-        linking_module, "get_kpms_root_data_dir"
-    ), "The linking module must specify a lookup function for a root data directory"
-
-    global _linking_module
-    _linking_module = linking_module
-
-    # activate
-    moseq_infer.activate(
-        infer_schema_name,
-        create_schema=create_schema,
-        create_tables=create_tables,
-        linking_module=linking_module,
-    )
-
-    schema.activate(
-        train_schema_name,
-        create_schema=create_schema,
-        create_tables=create_tables,
-        add_objects=_linking_module.__dict__,
-    )
-
-
-# ----------------------------- Table declarations ----------------------
-
-
-@schema
-class KeypointSet(dj.Manual):
-    """Store the keypoint data and the video set directory for model training.
-
-    Attributes:
-        kpset_id (int)                          : Unique ID for each keypoint set.
-        PoseEstimationMethod (foreign key)      : Unique format method used to obtain the keypoints data.
-        kpset_dir (str)                         : Path where the keypoint files are located together with the pose estimation `config` file, relative to root data directory.
-        kpset_desc (str)                            : Optional. User-entered description.
-    """
-
-    definition = """
-    kpset_id                        : int           # Unique ID for each keypoint set   
-    ---
-    -> moseq_infer.PoseEstimationMethod             # Unique format method used to obtain the keypoints data
-    kpset_dir                       : varchar(255)  # Path where the keypoint files are located together with the pose estimation `config` file, relative to root data directory 
-    kpset_desc=''                   : varchar(1000) # Optional. User-entered description
-    """
-
-    class VideoFile(dj.Part):
-        """Store the IDs and file paths of each video file that will be used for model training.
-
-        Attributes:
-            KeypointSet (foreign key) : Unique ID for each keypoint set.
-            video_id (int)            : Unique ID for each video corresponding to each keypoint data file, relative to root data directory.
-            video_path (str)          : Filepath of each video from which the keypoints are derived, relative to root data directory.
-        """
-
-        definition = """
-        -> master
-        video_id                    : int           # Unique ID for each video corresponding to each keypoint data file, relative to root data directory
-        ---
-        video_path                  : varchar(1000) # Filepath of each video from which the keypoints are derived, relative to root data directory
-        """
-
-
-@schema
-class Bodyparts(dj.Manual):
-    """Store the body parts to use in the analysis.
-
-    Attributes:
-        KeypointSet (foreign key)       : Unique ID for each `KeypointSet` key.
-        bodyparts_id (int)              : Unique ID for a set of bodyparts for a particular keypoint set.
-        anterior_bodyparts (blob)       : List of strings of anterior bodyparts
-        posterior_bodyparts (blob)      : List of strings of posterior bodyparts
-        use_bodyparts (blob)            : List of strings of bodyparts to be used
-        bodyparts_desc(varchar)         : Optional. User-entered description.
-    """
-
-    definition = """
-    -> KeypointSet                              # Unique ID for each `KeypointSet` key
-    bodyparts_id                : int           # Unique ID for a set of bodyparts for a particular keypoint set
-    ---
-    anterior_bodyparts          : blob          # List of strings of anterior bodyparts
-    posterior_bodyparts         : blob          # List of strings of posterior bodyparts
-    use_bodyparts               : blob          # List of strings of bodyparts to be used
-    bodyparts_desc=''           : varchar(1000) # Optional. User-entered description
-    """
-
-
-@schema
-class PCATask(dj.Manual):
-    """
-    Staging table to define the PCA task and its output directory.
-
-    Attributes:
-        Bodyparts (foreign key)         : Unique ID for each `Bodyparts` key
-        kpms_project_output_dir (str)   : Keypoint-MoSeq project output directory, relative to root data directory
-    """
-
-    definition = """ 
-    -> Bodyparts                                                # Unique ID for each `Bodyparts` key
-    ---
-    kpms_project_output_dir=''          : varchar(255)          # Keypoint-MoSeq project output directory, relative to root data directory
-    task_mode='load'                 :enum('load','trigger') # Trigger or load the task
-
-    """
-
-
-@schema
-class PCAPrep(dj.Imported):
-    """
-    Table to set up the Keypoint-MoSeq project output directory (`kpms_project_output_dir`) , creating the default `config.yml` and updating it in a new `kpms_dj_config.yml`.
-
-    Attributes:
-        PCATask (foreign key)           : Unique ID for each `PCATask` key.
-        coordinates (longblob)          : Dictionary mapping filenames to keypoint coordinates as ndarrays of shape (n_frames, n_bodyparts, 2[or 3]).
-        confidences (longblob)          : Dictionary mapping filenames to `likelihood` scores as ndarrays of shape (n_frames, n_bodyparts).
-        formatted_bodyparts (longblob)  : List of bodypart names. The order of the names matches the order of the bodyparts in `coordinates` and `confidences`.
-        average_frame_rate (float)      : Average frame rate of the videos for model training.
-        frame_rates (longblob)          : List of the frame rates of the videos for model training.
-    """
-
-    definition = """
-    -> PCATask                          # Unique ID for each `PCATask` key
-    ---
-    coordinates             : longblob  # Dictionary mapping filenames to keypoint coordinates as ndarrays of shape (n_frames, n_bodyparts, 2[or 3])
-    confidences             : longblob  # Dictionary mapping filenames to `likelihood` scores as ndarrays of shape (n_frames, n_bodyparts)           
-    formatted_bodyparts     : longblob  # List of bodypart names. The order of the names matches the order of the bodyparts in `coordinates` and `confidences`.
-    average_frame_rate      : float     # Average frame rate of the videos for model training
-    frame_rates             : longblob  # List of the frame rates of the videos for model training
-    """
-
-    def make(self, key):
-        """
-        Make function to:
-        1. Generate and update the `kpms_dj_config.yml` with both the videoset directory and the bodyparts.
-        2. Create the keypoint coordinates and confidences scores to format the data for the PCA fitting.
-
-        Args:
-            key (dict): Primary key from the `PCATask` table.
-
-        Raises:
-            NotImplementedError: `pose_estimation_method` is only supported for `deeplabcut`.
-
-        High-Level Logic:
-        1. Fetches the bodyparts, format method, and the directories for the Keypoint-MoSeq project output, the keypoint set, and the video set.
-        2. Set variables for each of the full path of the mentioned directories.
-        3. Find the first existing pose estimation config file in the `kpset_dir` directory, if not found, raise an error.
-        4. Check that the pose_estimation_method is `deeplabcut` and set up the project output directory with the default `config.yml`.
-        5. Create the `kpms_project_output_dir` (if it does not exist), and generates the kpms default `config.yml` with the default values from the pose estimation config.
-        6. Create a copy of the kpms `config.yml` named `kpms_dj_config.yml` that will be updated with both the `video_dir` and bodyparts
-        7. Load keypoint data from the keypoint files found in the `kpset_dir` that will serve as the training set.
-        8. As a result of the keypoint loading, the coordinates and confidences scores are generated and will be used to format the data for modeling.
-        9. Calculate the average frame rate and the frame rate list of the videoset from which the keypoint set is derived. This two attributes can be used to calculate the kappa value.
-        10. Insert the results of this `make` function into the table.
-        """
-        from keypoint_moseq import setup_project, load_config, load_keypoints
-
-        anterior_bodyparts, posterior_bodyparts, use_bodyparts = (
-            Bodyparts & key
-        ).fetch1(
-            "anterior_bodyparts",
-            "posterior_bodyparts",
-            "use_bodyparts",
-        )
-
-        pose_estimation_method, kpset_dir = (KeypointSet & key).fetch1(
-            "pose_estimation_method", "kpset_dir"
-        )
-        video_paths, video_ids = (KeypointSet.VideoFile & key).fetch(
-            "video_path", "video_id"
-        )
-
-        kpms_root = moseq_infer.get_kpms_root_data_dir()
-        kpms_processed = moseq_infer.get_kpms_processed_data_dir()
-
-        kpms_project_output_dir, task_mode = (PCATask & key).fetch1(
-            "kpms_project_output_dir", "task_mode"
-        )
-
-        if task_mode == "trigger":
-            try:
-                kpms_project_output_dir = find_full_path(
-                    kpms_processed, kpms_project_output_dir
-                )
-
-            except FileNotFoundError:
-                kpms_project_output_dir = kpms_processed / kpms_project_output_dir
-
-            kpset_dir = find_full_path(kpms_root, kpset_dir)
-            videos_dir = find_full_path(kpms_root, Path(video_paths[0]).parent)
-
-            if pose_estimation_method == "deeplabcut":
-                setup_project(
-                    project_dir=kpms_project_output_dir.as_posix(),
-                    deeplabcut_config=(kpset_dir / "config.yaml")
-                    or (kpset_dir / "config.yml"),
-                )
-            else:
-                raise NotImplementedError(
-                    "Currently, `deeplabcut` is the only pose estimation method supported by this Element. Please reach out at `support@datajoint.com` if you use another method."
-                )
-
-            kpms_config = load_config(
-                kpms_project_output_dir.as_posix(),
-                check_if_valid=True,
-                build_indexes=False,
-            )
-
-            kpms_dj_config_kwargs_dict = dict(
-                video_dir=videos_dir.as_posix(),
-                anterior_bodyparts=anterior_bodyparts,
-                posterior_bodyparts=posterior_bodyparts,
-                use_bodyparts=use_bodyparts,
-            )
-            kpms_config.update(**kpms_dj_config_kwargs_dict)
-            generate_kpms_dj_config(kpms_project_output_dir.as_posix(), **kpms_config)
-        else:
-            kpms_project_output_dir = find_full_path(
-                kpms_processed, kpms_project_output_dir
-            )
-            kpset_dir = find_full_path(kpms_root, kpset_dir)
-            videos_dir = find_full_path(kpms_root, Path(video_paths[0]).parent)
-
-        coordinates, confidences, formatted_bodyparts = load_keypoints(
-            filepath_pattern=kpset_dir, format=pose_estimation_method
-        )
-
-        frame_rate_list = []
-        for fp, _ in zip(video_paths, video_ids):
-            video_path = (find_full_path(kpms_root, fp)).as_posix()
-            cap = cv2.VideoCapture(video_path)
-            frame_rate_list.append(int(cap.get(cv2.CAP_PROP_FPS)))
-            cap.release()
-        average_frame_rate = int(np.mean(frame_rate_list))
-
-        self.insert1(
-            dict(
-                **key,
-                coordinates=coordinates,
-                confidences=confidences,
-                formatted_bodyparts=formatted_bodyparts,
-                average_frame_rate=average_frame_rate,
-                frame_rates=frame_rate_list,
-            )
-        )
-
-
-@schema
-class PCAFit(dj.Computed):
-    """Fit PCA model.
-
-    Attributes:
-        PCAPrep (foreign key)           : `PCAPrep` Key.
-        pca_fit_time (datetime)         : datetime of the PCA fitting analysis.
-    """
-
-    definition = """
-    -> PCAPrep                           # `PCAPrep` Key
-    ---
-    pca_fit_time=NULL        : datetime  # datetime of the PCA fitting analysis
-    """
-
-    def make(self, key):
-        """
-        Make function to format the keypoint data, fit the PCA model, and store it as a `pca.p` file in the Keypoint-MoSeq project output directory.
-        
-        Args:
-            key (dict): `PCAPrep` Key
-
-        Raises:
-
-        High-Level Logic:
-        1. Fetch the `kpms_project_output_dir` from the `PCATask` table and define its full path.
-        2. Load the `kpms_dj_config` file that contains the updated `video_dir` and bodyparts, \
-           and format the keypoint data with the coordinates and confidences scores to be used in the PCA fitting.
-        3. Fit the PCA model and save it as `pca.p` file in the output directory.
-        4.Insert the creation datetime as the `pca_fit_time` into the table.
-        """
-        from keypoint_moseq import format_data, fit_pca, save_pca
-
-        kpms_project_output_dir, task_mode = (PCATask & key).fetch1(
-            "kpms_project_output_dir", "task_mode"
-        )
-        kpms_project_output_dir = (
-            moseq_infer.get_kpms_processed_data_dir() / kpms_project_output_dir
-        )
-
-        kpms_default_config = load_kpms_dj_config(
-            kpms_project_output_dir.as_posix(), check_if_valid=True, build_indexes=True
-        )
-        coordinates, confidences = (PCAPrep & key).fetch1("coordinates", "confidences")
-        data, _ = format_data(
-            **kpms_default_config, coordinates=coordinates, confidences=confidences
-        )
-
-        if task_mode == "trigger":
-            pca = fit_pca(**data, **kpms_default_config)
-            save_pca(pca, kpms_project_output_dir.as_posix())
-            creation_datetime = datetime.now(timezone.utc)
-        else:
-            creation_datetime = None
-
-        self.insert1(dict(**key, pca_fit_time=creation_datetime))
-
-
-@schema
-class LatentDimension(dj.Imported):
-    """
-    Determine the latent dimension as part of the autoregressive hyperparameters (`ar_hypparams`) for the model fitting.
-    The objective of the analysis is to inform the user about the number of principal components needed to explain a
-    90% variance threshold. Subsequently, the decision on how many components to utilize for the model fitting is left
-    to the user.
-
-    Attributes:
-        PCAFit (foreign key)               : `PCAFit` Key.
-        variance_percentage (float)        : Variance threshold. Fixed value to 90%.
-        latent_dimension (int)             : Number of principal components required to explain the specified variance.
-        latent_dim_desc (varchar)          : Automated description of the computation result.
-    """
-
-    definition = """
-    -> PCAFit                                   # `PCAFit` Key
-    ---
-    variance_percentage      : float            # Variance threshold. Fixed value to 90 percent.
-    latent_dimension         : int              # Number of principal components required to explain the specified variance.
-    latent_dim_desc          : varchar(1000)    # Automated description of the computation result.
-    """
-
-    def make(self, key):
-        """
-        Make function to compute and store the latent dimension that explains a 90% variance threshold.
-
-        Args:
-            key (dict): `PCAFit` Key.
-
-        Raises:
-
-        High-Level Logic:
-        1. Fetches the Keypoint-MoSeq project output directory from the PCATask table and define the full path.
-        2. Load the PCA model from file in this directory.
-        2. Set a specified variance threshold to 90% and compute the cumulative sum of the explained variance ratio.
-        3. Determine the number of components required to explain the specified variance.
-            3.1 If the cumulative sum of the explained variance ratio is less than the specified variance threshold, \
-                it sets the `latent_dimension` to the total number of components and `variance_percentage` to the cumulative sum of the explained variance ratio.
-            3.2 If the cumulative sum of the explained variance ratio is greater than the specified variance threshold, \
-                it sets the `latent_dimension` to the number of components that explain the specified variance and `variance_percentage` to the specified variance threshold.
-        4. Insert the results of this `make` function into the table.
-        """
-        from keypoint_moseq import load_pca
-
-        kpms_project_output_dir = (PCATask & key).fetch1("kpms_project_output_dir")
-        kpms_project_output_dir = (
-            moseq_infer.get_kpms_processed_data_dir() / kpms_project_output_dir
-        )
-
-        pca_path = kpms_project_output_dir / "pca.p"
-        if pca_path:
-            pca = load_pca(kpms_project_output_dir.as_posix())
-        else:
-            raise FileNotFoundError(
-                f"No pca model (`pca.p`) found in the project directory {kpms_project_output_dir}"
-            )
-
-        variance_threshold = 0.90
-
-        cs = np.cumsum(
-            pca.explained_variance_ratio_
-        )  # explained_variance_ratio_ndarray of shape (n_components,)
-
-        if cs[-1] < variance_threshold:
-            latent_dimension = len(cs)
-            variance_percentage = cs[-1] * 100
-            latent_dim_desc = (
-                f"All components together only explain {cs[-1]*100}% of variance."
-            )
-        else:
-            latent_dimension = (cs > variance_threshold).nonzero()[0].min() + 1
-            variance_percentage = variance_threshold * 100
-            latent_dim_desc = f">={variance_threshold*100}% of variance explained by {(cs>variance_threshold).nonzero()[0].min()+1} components."
-
-        self.insert1(
-            dict(
-                **key,
-                variance_percentage=variance_percentage,
-                latent_dimension=latent_dimension,
-                latent_dim_desc=latent_dim_desc,
-            )
-        )
-
-
-@schema
-class PreFitTask(dj.Lookup):
-    """Insert the parameters for the model (AR-HMM) pre-fitting.
-
-    Attributes:
-        PCAFit (foreign key)                : `PCAFit` task.
-        prefit_id (smallint unsigned)       : Unique ID for each pre-fitting task.
-        pre_latent_dim (int)                : Latent dimension to use for the model pre-fitting.
-        pre_kappa (int)                     : Kappa value to use for the model pre-fitting.
-        pre_num_iterations (int)            : Number of Gibbs sampling iterations to run in the model pre-fitting.
-        pre_fit_desc(varchar)               : User-defined description of the pre-fitting task.
-    """
-
-    definition = """
-    -> PCAFit                                           # `PCAFit` Key
-    prefit_id                    : smallint unsigned    # Unique ID for each pre-fitting task
-    ---
-    pre_latent_dim               : int                  # Latent dimension to use for the model pre-fitting
-    pre_kappa                    : int                  # Kappa value to use for the model pre-fitting
-    pre_num_iterations           : int                  # Number of Gibbs sampling iterations to run in the model pre-fitting
-    model_name                   : varchar(100)         # Name of the model to be loaded if `task_mode='load'`
-    task_mode='load'             :enum('trigger','load')# 'load': load computed analysis results, 'trigger': trigger computation
-    pre_fit_desc=''              : varchar(1000)        # User-defined description of the pre-fitting task
-    """
-
-
-@schema
-class PreFit(dj.Computed):
-    """Fit AR-HMM model.
-
-    Attributes:
-        PreFitTask (foreign key)                : `PreFitTask` Key.
-        model_name (varchar)                    : Name of the model as "kpms_project_output_dir/model_name".
-        pre_fit_duration (float)                : Time duration (seconds) of the model fitting computation.
-    """
-
-    definition = """
-    -> PreFitTask                               # `PreFitTask` Key
-    ---
-    model_name=''                : varchar(100) # Name of the model as "kpms_project_output_dir/model_name"
-    pre_fit_duration=NULL        : float        # Time duration (seconds) of the model fitting computation
-    """
-
-    def make(self, key):
-        """
-        Make function to fit the AR-HMM model using the latent trajectory defined by `model['states']['x'].
-
-        Args:
-            key (dict) : dictionary with the `PreFitTask` Key.
-
-        Raises:
-
-        High-level Logic:
-        1. Fetch the `kpms_project_output_dir` and define the full path.
-        2. Fetch the model parameters from the `PreFitTask` table.
-        3. Update the `dj_config.yml` with the latent dimension and kappa for the AR-HMM fitting.
-        4. Load the pca model from file in the `kpms_project_output_dir`.
-        5. Fetch `coordinates` and `confidences` scores to format the data for the model initialization. \
-            # Data - contains the data for model fitting. \
-            # Metadata - contains the recordings and start/end frames for the data.
-        6. Initialize the model that create a `model` dict containing states, parameters, hyperparameters, noise prior, and random seed.
-        7. Update the model dict with the selected kappa for the AR-HMM fitting.
-        8. Fit the AR-HMM model using the `pre_num_iterations` and create a subdirectory in `kpms_project_output_dir` with the model's latest checkpoint file.
-        9. Calculate the duration of the model fitting computation and insert it in the `PreFit` table.
-        """
-        from keypoint_moseq import (
-            load_pca,
-            format_data,
-            init_model,
-            update_hypparams,
-            fit_model,
-        )
-
-        kpms_processed = moseq_infer.get_kpms_processed_data_dir()
-
-        kpms_project_output_dir = find_full_path(
-            kpms_processed, (PCATask & key).fetch1("kpms_project_output_dir")
-        )
-
-        pre_latent_dim, pre_kappa, pre_num_iterations, task_mode, model_name = (
-            PreFitTask & key
-        ).fetch1(
-            "pre_latent_dim",
-            "pre_kappa",
-            "pre_num_iterations",
-            "task_mode",
-            "model_name",
-        )
-        if task_mode == "trigger":
-            kpms_dj_config = load_kpms_dj_config(
-                kpms_project_output_dir.as_posix(),
-                check_if_valid=True,
-                build_indexes=True,
-            )
-
-            kpms_dj_config.update(
-                dict(latent_dim=int(pre_latent_dim), kappa=float(pre_kappa))
-            )
-            generate_kpms_dj_config(
-                kpms_project_output_dir.as_posix(), **kpms_dj_config
-            )
-
-            pca_path = kpms_project_output_dir / "pca.p"
-            if pca_path:
-                pca = load_pca(kpms_project_output_dir.as_posix())
-            else:
-                raise FileNotFoundError(
-                    f"No pca model (`pca.p`) found in the project directory {kpms_project_output_dir}"
-                )
-
-            coordinates, confidences = (PCAPrep & key).fetch1(
-                "coordinates", "confidences"
-            )
-            data, metadata = format_data(coordinates, confidences, **kpms_dj_config)
-
-            model = init_model(data=data, metadata=metadata, pca=pca, **kpms_dj_config)
-
-            model = update_hypparams(
-                model, kappa=float(pre_kappa), latent_dim=int(pre_latent_dim)
-            )
-
-            start_time = datetime.now()
-            model, model_name = fit_model(
-                model=model,
-                data=data,
-                metadata=metadata,
-                project_dir=kpms_project_output_dir.as_posix(),
-                ar_only=True,
-                num_iters=pre_num_iterations,
-            )
-            end_time = datetime.now()
-
-            duration_seconds = (end_time - start_time).total_seconds()
-        else:
-            duration_seconds = None
-
-        self.insert1(
-            {
-                **key,
-                "model_name": (
-                    kpms_project_output_dir.relative_to(kpms_processed) / model_name
-                ).as_posix(),
-                "pre_fit_duration": duration_seconds,
-            }
-        )
-
-
-@schema
-class FullFitTask(dj.Lookup):
-    """Insert the parameters for the full (Keypoint-SLDS model) fitting.
-       The full model will generally require a lower value of kappa to yield the same target syllable durations.
-
-    Attributes:
-        PCAFit (foreign key)                 : `PCAFit` Key.
-        fullfit_id (smallint unsigned)       : Unique ID for each full fitting task.
-        full_latent_dim (int)                : Latent dimension to use for the model full fitting.
-        full_kappa (int)                     : Kappa value to use for the model full fitting.
-        full_num_iterations (int)            : Number of Gibbs sampling iterations to run in the model full fitting.
-        full_fit_desc(varchar)               : User-defined description of the model full fitting task.
-
-    """
-
-    definition = """
-    -> PCAFit                                           # `PCAFit` Key
-    fullfit_id                   : smallint unsigned    # Unique ID for each full fitting task
-    ---
-    full_latent_dim              : int                  # Latent dimension to use for the model full fitting
-    full_kappa                   : int                  # Kappa value to use for the model full fitting
-    full_num_iterations          : int                  # Number of Gibbs sampling iterations to run in the model full fitting
-    model_name                   : varchar(100)         # Name of the model to be loaded if `task_mode='load'`
-    task_mode='load'             :enum('load','trigger')# Trigger or load the task
-    full_fit_desc=''             : varchar(1000)        # User-defined description of the model full fitting task   
-    """
-
-
-@schema
-class FullFit(dj.Computed):
-    """Fit the full (Keypoint-SLDS) model.
-
-    Attributes:
-        FullFitTask (foreign key)            : `FullFitTask` Key.
-        model_name                           : varchar(100) # Name of the model as "kpms_project_output_dir/model_name"
-        full_fit_duration (float)            : Time duration (seconds) of the full fitting computation
-    """
-
-    definition = """
-    -> FullFitTask                               # `FullFitTask` Key
-    ---
-    model_name                    : varchar(100) # Name of the model as "kpms_project_output_dir/model_name"
-    full_fit_duration=NULL        : float        # Time duration (seconds) of the full fitting computation 
-    """
-
-    def make(self, key):
-        """
-            Make function to fit the full (keypoint-SLDS) model
-
-            Args:
-                key (dict): dictionary with the `FullFitTask` Key.
-
-            Raises:
-
-            High-level Logic:
-            1. Fetch the `kpms_project_output_dir` and define the full path.
-            2. Fetch the model parameters from the `FullFitTask` table.
-            2. Update the `dj_config.yml` with the selected latent dimension and kappa for the full-fitting.
-            3. Initialize and fit the full model in a new `model_name` directory.
-            4. Load the pca model from file in the `kpms_project_output_dir`.
-            5. Fetch the `coordinates` and `confidences` scores to format the data for the model initialization.
-            6. Initialize the model that create a `model` dict containing states, parameters, hyperparameters, noise prior, and random seed.
-            7. Update the model dict with the selected kappa for the Keypoint-SLDS fitting.
-            8. Fit the Keypoint-SLDS model using the `full_num_iterations` and create a subdirectory in `kpms_project_output_dir` with the model's latest checkpoint file.
-            8. Reindex syllable labels by their frequency in the most recent model snapshot in the checkpoint file. \
-                This function permutes the states and parameters of a saved checkpoint so that syllables are labeled \
-                in order of frequency (i.e. so that 0 is the most frequent, 1 is the second most, and so on).
-            8. Calculate the duration of the model fitting computation and insert it in the `PreFit` table.
-        """
-        from keypoint_moseq import (
-            load_pca,
-            format_data,
-            init_model,
-            update_hypparams,
-            fit_model,
-            reindex_syllables_in_checkpoint,
-        )
-
-        kpms_processed = moseq_infer.get_kpms_processed_data_dir()
-
-        kpms_project_output_dir = find_full_path(
-            kpms_processed, (PCATask & key).fetch1("kpms_project_output_dir")
-        )
-
-        full_latent_dim, full_kappa, full_num_iterations, task_mode, model_name = (
-            FullFitTask & key
-        ).fetch1(
-            "full_latent_dim",
-            "full_kappa",
-            "full_num_iterations",
-            "task_mode",
-            "model_name",
-        )
-        if task_mode == "trigger":
-            kpms_dj_config = load_kpms_dj_config(
-                kpms_project_output_dir.as_posix(),
-                check_if_valid=True,
-                build_indexes=True,
-            )
-            kpms_dj_config.update(
-                dict(latent_dim=int(full_latent_dim), kappa=float(full_kappa))
-            )
-            generate_kpms_dj_config(
-                kpms_project_output_dir.as_posix(), **kpms_dj_config
-            )
-
-            pca_path = kpms_project_output_dir / "pca.p"
-            if pca_path:
-                pca = load_pca(kpms_project_output_dir.as_posix())
-            else:
-                raise FileNotFoundError(
-                    f"No pca model (`pca.p`) found in the project directory {kpms_project_output_dir}"
-                )
-
-            coordinates, confidences = (PCAPrep & key).fetch1(
-                "coordinates", "confidences"
-            )
-            data, metadata = format_data(coordinates, confidences, **kpms_dj_config)
-            model = init_model(data=data, metadata=metadata, pca=pca, **kpms_dj_config)
-            model = update_hypparams(
-                model, kappa=float(full_kappa), latent_dim=int(full_latent_dim)
-            )
-
-            start_time = datetime.utcnow()
-            model, model_name = fit_model(
-                model=model,
-                data=data,
-                metadata=metadata,
-                project_dir=kpms_project_output_dir.as_posix(),
-                ar_only=False,
-                num_iters=full_num_iterations,
-            )
-            end_time = datetime.utcnow()
-            duration_seconds = (end_time - start_time).total_seconds()
-
-            reindex_syllables_in_checkpoint(
-                kpms_project_output_dir.as_posix(), Path(model_name).parts[-1]
-            )
-        else:
-            duration_seconds = None
-
-        self.insert1(
-            {
-                **key,
-                "model_name": (
-                    kpms_project_output_dir.relative_to(kpms_processed) / model_name
-                ).as_posix(),
-                "full_fit_duration": duration_seconds,
-            }
-        )
+from datetime import datetime, timezone
+from functools import lru_cache
+import inspect
+import os
+import subprocess
+from pathlib import Path
+import numpy as np
+import datajoint as dj
+import importlib
+
+from element_interface.utils import find_full_path
+from .readers.kpms_reader import (
+    generate_kpms_dj_config,
+    load_kpms_dj_config_cached,
+    load_keypoints_parallel,
+)
+
+from . import moseq_infer
+
+schema = dj.schema()
+
+_linking_module = None
+
+
+def activate(
+    train_schema_name: str,
+    infer_schema_name: str = None,
+    *,
+    create_schema: bool = True,
+    create_tables: bool = True,
+    linking_module: str = None,
+):
+    """Activate this schema.
+
+    Args:
+        train_schema_name (str): A string containing the name of the `moseq_train` schema.
+        infer_schema_name (str): A string containing the name of the `moseq_infer` schema.
+        create_schema (bool): If True (default), schema  will be created in the database.
+        create_tables (bool): If True (default), tables related to the schema will be created in the database.
+        linking_module (str): A string containing the module name or module containing the required dependencies to activate the schema.
+
+    """
+
+    if isinstance(linking_module, str):
+        linking_module = importlib.import_module(linking_module)
+    assert inspect.ismodule(
+        linking_module
+    ), "The argument 'dependency' must be a module's name or a module"
+
+    assert hasattr(
+        linking_module, "get_kpms_root_data_dir"
+    ), "The linking module must specify a lookup function for a root data directory"
+
+    global _linking_module
+    _linking_module = linking_module
+
+    # activate
+    moseq_infer.activate(
+        infer_schema_name,
+        create_schema=create_schema,
+        create_tables=create_tables,
+        linking_module=linking_module,
+    )
+
+    schema.activate(
+        train_schema_name,
+        create_schema=create_schema,
+        create_tables=create_tables,
+        add_objects=_linking_module.__dict__,
+    )
+
+
+# ----------------------------- Helper functions -----------------------
+
+
+def _probe_fps(video_path) -> int:
+    """Read the frame rate of a video from its container metadata with `ffprobe`.
+
+    Unlike `cv2.VideoCapture`, this reads only the container header (no decoder
+    initialization), which keeps the per-video cost to a few milliseconds.
+
+    On GPU-equipped workers, setting the environment variable `KPMS_USE_NVDEC`
+    routes the probe through `ffmpegcv.VideoCaptureNV` (NVDEC hardware
+    demuxer) instead; if NVDEC initialization fails, the probe falls back to
+    `ffprobe`.
+
+    Args:
+        video_path (str or Path): Full path of the video file.
+
+    Returns:
+        fps (int): Frame rate of the video, rounded to the nearest integer.
+    """
+    if os.getenv("KPMS_USE_NVDEC"):
+        try:
+            import ffmpegcv
+
+            cap = ffmpegcv.VideoCaptureNV(os.fspath(video_path))
+            try:
+                return int(round(cap.fps))
+            finally:
+                cap.release()
+        except Exception:
+            pass  # NVDEC unavailable for this file/worker; fall back to ffprobe
+
+    proc = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "stream=r_frame_rate",
+            "-of",
+            "csv=p=0",
+            str(video_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # ffprobe reports "0/0" (or nothing) for streams with an unknown rate
+    num, _, den = proc.stdout.strip().partition("/")
+    try:
+        fps = int(num) / int(den or 1)
+    except (ValueError, ZeroDivisionError):
+        fps = 0
+    if not fps:
+        raise ValueError(
+            f"ffprobe reported no valid frame rate "
+            f"({proc.stdout.strip()!r}) for {video_path}"
+        )
+    return int(round(fps))
+
+
+@lru_cache(maxsize=32)
+def _cached_load_config(output_dir, mtime):
+    """Load the kpms `config.yml` from the output directory, memoized per file.
+
+    The `mtime` argument keys the cache, so a rewritten config file is reparsed
+    while repeated loads of an unchanged file skip the YAML round-trip and
+    validation entirely.
+
+    Args:
+        output_dir (str): Directory containing the `config.yml`.
+        mtime (float): Modification time of the `config.yml` file.
+
+    Returns:
+        kpms_config (dict): Configuration settings.
+    """
+    from keypoint_moseq import load_config
+
+    return load_config(output_dir, check_if_valid=True, build_indexes=False)
+
+
+@lru_cache(maxsize=8)
+def _load_keypoints_cached(kpset_dir, pose_estimation_method):
+    """Load the keypoint data for a keypoint set, memoized per process.
+
+    `PCAFit`, `PreFit`, and `FullFit` all need the same
+    `(coordinates, confidences, bodyparts)` structures; caching the parse lets
+    the downstream tables of one populate session share a single read of the
+    source files instead of each re-deserializing the data.
+
+    Args:
+        kpset_dir (str): Full path of the directory containing the keypoint files.
+        pose_estimation_method (str): Pose estimation method used to obtain the keypoints data.
+
+    Returns:
+        coordinates (dict): Dictionary mapping recording names to keypoint coordinates, as float32.
+        confidences (dict): Dictionary mapping recording names to `likelihood` scores, as float32.
+        bodyparts (list): List of bodypart names.
+    """
+    # `load_keypoints_parallel` already returns float32 arrays
+    return load_keypoints_parallel(
+        filepath_pattern=kpset_dir, format=pose_estimation_method
+    )
+
+
+def _format_data_cached(kpms_dj_config, coordinates, confidences, output_dir):
+    """Run `keypoint_moseq.format_data`, caching the formatted output on disk.
+
+    The formatted `(data, metadata)` pair is a deterministic function of the
+    keypoint inputs and the preprocessing config, so it is stored as a
+    protocol-5 pickle in the project output directory keyed by a hash of the
+    recording names, array contents, and the config keys that shape the output.
+    Re-fits over the same keypoint set (e.g. hyperparameter sweeps) then load
+    the arrays from disk instead of redoing the O(frames) reshape/centering
+    work.
+
+    Args:
+        kpms_dj_config (dict): kpms configuration settings.
+        coordinates (dict): Dictionary mapping recording names to keypoint coordinates.
+        confidences (dict): Dictionary mapping recording names to `likelihood` scores.
+        output_dir (Path): Keypoint-MoSeq project output directory holding the cache.
+
+    Returns:
+        data (dict): Formatted data for model fitting.
+        metadata (tuple): Recording names and start/end frames for the data.
+    """
+    import hashlib
+    import pickle
+
+    from keypoint_moseq import format_data
+
+    # hash the array contents, not just names and shapes, so re-exported
+    # keypoint files (e.g. after retraining a DLC model) invalidate the cache
+    digest = hashlib.sha1()
+    for name in sorted(coordinates):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(coordinates[name]).tobytes())
+        digest.update(np.ascontiguousarray(confidences[name]).tobytes())
+    digest.update(
+        str(
+            {
+                k: kpms_dj_config.get(k)
+                for k in ("use_bodyparts", "conf_pseudocount", "seg_length")
+            }
+        ).encode()
+    )
+    cache_path = Path(output_dir) / f"formatted_{digest.hexdigest()}.p"
+
+    if cache_path.exists():
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+
+    data, metadata = format_data(
+        **kpms_dj_config, coordinates=coordinates, confidences=confidences
+    )
+    data = {k: np.asarray(v) for k, v in data.items()}
+    with open(cache_path, "wb") as f:
+        pickle.dump((data, metadata), f, protocol=5)
+    return data, metadata
+
+
+def _populate_worker(table_names):
+    """Populate the named tables of this module with job reservation."""
+    # open a fresh connection for this process; MySQL sockets are not
+    # fork-safe and must not be shared with the parent or sibling workers
+    dj.conn().connect()
+    for table_name in table_names:
+        globals()[table_name].populate(
+            reserve_jobs=True, suppress_errors=True, order="random"
+        )
+
+
+def populate_pca_prep(
+    workers=4, table_names=("VideoFPS", "PCAPrep", "PCAFit", "LatentDimension")
+):
+    """Populate the PCA preparation and fitting tables with multiple worker processes.
+
+    Each worker runs `populate(reserve_jobs=True, suppress_errors=True,
+    order="random")`, so independent keys are reserved optimistically in the
+    database job table and processed in parallel without inter-worker locking.
+
+    Args:
+        workers (int): default=4. Number of worker processes to spawn.
+        table_names (tuple): default=("VideoFPS", "PCAPrep", "PCAFit", "LatentDimension"). Names of the tables to populate, in dependency order.
+    """
+    from multiprocessing import Process
+
+    # close the parent connection so forked workers do not inherit its
+    # socket; both the parent and the workers reconnect on demand
+    dj.conn().close()
+
+    processes = [
+        Process(target=_populate_worker, args=(table_names,)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+# ----------------------------- Table declarations ----------------------
+
+
+@schema
+class KeypointSet(dj.Manual):
+    """Store the keypoint data and the video set directory for model training.
+
+    Attributes:
+        kpset_id (int)                          : Unique ID for each keypoint set.
+        PoseEstimationMethod (foreign key)      : Unique format method used to obtain the keypoints data.
+        kpset_dir (str)                         : Path where the keypoint files are located together with the pose estimation `config` file, relative to root data directory.
+        kpset_desc (str)                            : Optional. User-entered description.
+    """
+
+    definition = """
+    kpset_id                        : int           # Unique ID for each keypoint set   
+    ---
+    -> moseq_infer.PoseEstimationMethod             # Unique format method used to obtain the keypoints data
+    kpset_dir                       : varchar(255)  # Path where the keypoint files are located together with the pose estimation `config` file, relative to root data directory 
+    kpset_desc=''                   : varchar(1000) # Optional. User-entered description
+    """
+
+    class VideoFile(dj.Part):
+        """Store the IDs and file paths of each video file that will be used for model training.
+
+        Attributes:
+            KeypointSet (foreign key) : Unique ID for each keypoint set.
+            video_id (int)            : Unique ID for each video corresponding to each keypoint data file, relative to root data directory.
+            video_path (str)          : Filepath of each video from which the keypoints are derived, relative to root data directory.
+        """
+
+        definition = """
+        -> master
+        video_id                    : int           # Unique ID for each video corresponding to each keypoint data file, relative to root data directory
+        ---
+        video_path                  : varchar(1000) # Filepath of each video from which the keypoints are derived, relative to root data directory
+        """
+
+
+@schema
+class VideoFPS(dj.Imported):
+    """Store the frame rate of each training video.
+
+    Video files are immutable, so the frame rate is probed once per video and
+    reused by every `PCAPrep` run that references the same `KeypointSet`.
+
+    Attributes:
+        KeypointSet.VideoFile (foreign key) : `KeypointSet.VideoFile` key.
+        fps (int)                           : Frame rate of the video.
+    """
+
+    definition = """
+    -> KeypointSet.VideoFile            # `KeypointSet.VideoFile` key
+    ---
+    fps                     : int       # Frame rate of the video
+    """
+
+    def make(self, key):
+        """
+        Make function to probe and store the frame rate of one training video.
+
+        Args:
+            key (dict): Primary key from the `KeypointSet.VideoFile` table.
+        """
+        video_path = (KeypointSet.VideoFile & key).fetch1("video_path")
+        # `_probe_fps` accepts the Path directly; no `.as_posix()` round-trip
+        video_path = find_full_path(moseq_infer.get_kpms_root_data_dir(), video_path)
+
+        # `allow_direct_insert` lets `PCAPrep.make` call this `make` inline
+        # for videos that have not been populated yet
+        self.insert1(dict(**key, fps=_probe_fps(video_path)), allow_direct_insert=True)
+
+
+@schema
+class Bodyparts(dj.Manual):
+    """Store the body parts to use in the analysis.
+
+    Attributes:
+        KeypointSet (foreign key)       : Unique ID for each `KeypointSet` key.
+        bodyparts_id (int)              : Unique ID for a set of bodyparts for a particular keypoint set.
+        anterior_bodyparts (blob)       : List of strings of anterior bodyparts
+        posterior_bodyparts (blob)      : List of strings of posterior bodyparts
+        use_bodyparts (blob)            : List of strings of bodyparts to be used
+        bodyparts_desc(varchar)         : Optional. User-entered description.
+    """
+
+    definition = """
+    -> KeypointSet                              # Unique ID for each `KeypointSet` key
+    bodyparts_id                : int           # Unique ID for a set of bodyparts for a particular keypoint set
+    ---
+    anterior_bodyparts          : blob          # List of strings of anterior bodyparts
+    posterior_bodyparts         : blob          # List of strings of posterior bodyparts
+    use_bodyparts               : blob          # List of strings of bodyparts to be used
+    bodyparts_desc=''           : varchar(1000) # Optional. User-entered description
+    """
+
+
+@schema
+class PCATask(dj.Manual):
+    """
+    Staging table to define the PCA task and its output directory.
+
+    Attributes:
+        Bodyparts (foreign key)         : Unique ID for each `Bodyparts` key
+        kpms_project_output_dir (str)   : Keypoint-MoSeq project output directory, relative to root data directory
+    """
+
+    definition = """ 
+    -> Bodyparts                                                # Unique ID for each `Bodyparts` key
+    ---
+    kpms_project_output_dir=''          : varchar(255)          # Keypoint-MoSeq project output directory, relative to root data directory
+    task_mode='load'                 :enum('load','trigger') # Trigger or load the task
+
+    """
+
+
+@schema
+class PCAPrep(dj.Imported):
+    """
+    Table to set up the Keypoint-MoSeq project output directory (`kpms_project_output_dir`) , creating the default `config.yml` and updating it in a new `kpms_dj_config.yml`.
+
+    Attributes:
+        PCATask (foreign key)           : Unique ID for each `PCATask` key.
+        coordinates (longblob)          : Dictionary mapping filenames to keypoint coordinates as ndarrays of shape (n_frames, n_bodyparts, 2[or 3]).
+        confidences (longblob)          : Dictionary mapping filenames to `likelihood` scores as ndarrays of shape (n_frames, n_bodyparts).
+        formatted_bodyparts (longblob)  : List of bodypart names. The order of the names matches the order of the bodyparts in `coordinates` and `confidences`.
+        average_frame_rate (float)      : Average frame rate of the videos for model training.
+        frame_rates (longblob)          : List of the frame rates of the videos for model training.
+    """
+
+    definition = """
+    -> PCATask                          # Unique ID for each `PCATask` key
+    ---
+    coordinates             : longblob  # Dictionary mapping filenames to keypoint coordinates as ndarrays of shape (n_frames, n_bodyparts, 2[or 3])
+    confidences             : longblob  # Dictionary mapping filenames to `likelihood` scores as ndarrays of shape (n_frames, n_bodyparts)           
+    formatted_bodyparts     : longblob  # List of bodypart names. The order of the names matches the order of the bodyparts in `coordinates` and `confidences`.
+    average_frame_rate      : float     # Average frame rate of the videos for model training
+    frame_rates             : longblob  # List of the frame rates of the videos for model training
+    """
+
+    def make(self, key):
+        """
+        Make function to:
+        1. Generate and update the `kpms_dj_config.yml` with both the videoset directory and the bodyparts.
+        2. Create the keypoint coordinates and confidences scores to format the data for the PCA fitting.
+
+        Args:
+            key (dict): Primary key from the `PCATask` table.
+
+        Raises:
+            NotImplementedError: `pose_estimation_method` is only supported for `deeplabcut`.
+
+        High-Level Logic:
+        1. Fetches the bodyparts, format method, and the directories for the Keypoint-MoSeq project output, the keypoint set, and the video set.
+        2. Check that the pose_estimation_method is `deeplabcut`, raising an error before any filesystem work otherwise.
+        3. Set variables for each of the full path of the mentioned directories.
+        4. Find the first existing pose estimation config file in the `kpset_dir` directory, if not found, raise an error, and set up the project output directory with the default `config.yml`.
+        5. Create the `kpms_project_output_dir` (if it does not exist), and generates the kpms default `config.yml` with the default values from the pose estimation config.
+        6. Create a copy of the kpms `config.yml` named `kpms_dj_config.yml` that will be updated with both the `video_dir` and bodyparts
+        7. Load keypoint data from the keypoint files found in the `kpset_dir` that will serve as the training set.
+        8. As a result of the keypoint loading, the coordinates and confidences scores are generated and will be used to format the data for modeling.
+        9. Calculate the average frame rate and the frame rate list of the videoset from which the keypoint set is derived. This two attributes can be used to calculate the kappa value.
+        10. Insert the results of this `make` function into the table.
+        """
+        from keypoint_moseq import setup_project
+
+        # single joined query instead of three sequential per-table fetches
+        (
+            anterior_bodyparts,
+            posterior_bodyparts,
+            use_bodyparts,
+            pose_estimation_method,
+            kpset_dir,
+            kpms_project_output_dir,
+            task_mode,
+        ) = (PCATask * KeypointSet * Bodyparts & key).fetch1(
+            "anterior_bodyparts",
+            "posterior_bodyparts",
+            "use_bodyparts",
+            "pose_estimation_method",
+            "kpset_dir",
+            "kpms_project_output_dir",
+            "task_mode",
+        )
+
+        # Fail fast before any project directories are created or config
+        # files are written for a key that cannot be processed.
+        if pose_estimation_method != "deeplabcut":
+            raise NotImplementedError(
+                "Currently, `deeplabcut` is the only pose estimation method supported by this Element. Please reach out at `support@datajoint.com` if you use another method."
+            )
+
+        video_paths = (KeypointSet.VideoFile & key).fetch("video_path")
+
+        kpms_root = moseq_infer.get_kpms_root_data_dir()
+        kpms_processed = moseq_infer.get_kpms_processed_data_dir()
+
+        # Resolve each directory against the root list once; `find_full_path`
+        # walks the candidate roots (with an `exists` check per candidate) on
+        # every call.
+        kpset_dir = find_full_path(kpms_root, kpset_dir)
+        videos_dir = find_full_path(kpms_root, Path(video_paths[0]).parent)
+
+        if task_mode == "trigger":
+            try:
+                kpms_project_output_dir = find_full_path(
+                    kpms_processed, kpms_project_output_dir
+                )
+
+            except FileNotFoundError:
+                kpms_project_output_dir = kpms_processed / kpms_project_output_dir
+
+            setup_project(
+                project_dir=kpms_project_output_dir.as_posix(),
+                deeplabcut_config=(kpset_dir / "config.yaml")
+                or (kpset_dir / "config.yml"),
+            )
+
+            # copy: the cached dict must not be mutated by the update below
+            kpms_config = dict(
+                _cached_load_config(
+                    kpms_project_output_dir.as_posix(),
+                    os.path.getmtime(kpms_project_output_dir / "config.yml"),
+                )
+            )
+
+            kpms_dj_config_kwargs_dict = dict(
+                video_dir=videos_dir.as_posix(),
+                anterior_bodyparts=anterior_bodyparts,
+                posterior_bodyparts=posterior_bodyparts,
+                use_bodyparts=use_bodyparts,
+            )
+            kpms_config.update(**kpms_dj_config_kwargs_dict)
+            generate_kpms_dj_config(kpms_project_output_dir.as_posix(), **kpms_config)
+        else:
+            kpms_project_output_dir = find_full_path(
+                kpms_processed, kpms_project_output_dir
+            )
+
+        coordinates, confidences, formatted_bodyparts = load_keypoints_parallel(
+            filepath_pattern=kpset_dir, format=pose_estimation_method
+        )
+
+        # `populate()` cannot be called inside the transaction that wraps this
+        # `make`, so videos not yet in `VideoFPS` are probed inline instead.
+        for video_key in ((KeypointSet.VideoFile & key) - VideoFPS).fetch("KEY"):
+            VideoFPS().make(video_key)
+
+        frame_rate_list = (VideoFPS & key).fetch("fps", order_by="video_id")
+        if len(frame_rate_list) != len(video_paths):
+            raise ValueError(
+                f"Expected {len(video_paths)} frame rates in `VideoFPS` for {key}, "
+                f"found {len(frame_rate_list)}."
+            )
+        average_frame_rate = int(round(sum(frame_rate_list) / len(frame_rate_list)))
+
+        self.insert1(
+            dict(
+                **key,
+                coordinates=coordinates,
+                confidences=confidences,
+                formatted_bodyparts=formatted_bodyparts,
+                average_frame_rate=average_frame_rate,
+                frame_rates=frame_rate_list,
+            )
+        )
+
+
+@schema
+class PCAFit(dj.Computed):
+    """Fit PCA model.
+
+    Attributes:
+        PCAPrep (foreign key)               : `PCAPrep` Key.
+        pca_fit_time (datetime)             : datetime of the PCA fitting analysis.
+        explained_variance_ratio (longblob) : Explained variance ratio of the PCA components, as an ndarray of shape (n_components,).
+    """
+
+    definition = """
+    -> PCAPrep                                  # `PCAPrep` Key
+    ---
+    pca_fit_time=NULL               : datetime  # datetime of the PCA fitting analysis
+    explained_variance_ratio=NULL   : longblob  # Explained variance ratio of the PCA components, as an ndarray of shape (n_components,)
+    """
+
+    def make(self, key):
+        """
+        Make function to format the keypoint data, fit the PCA model, and store it as a `pca.p` file in the Keypoint-MoSeq project output directory.
+        
+        Args:
+            key (dict): `PCAPrep` Key
+
+        Raises:
+
+        High-Level Logic:
+        1. Fetch the `kpms_project_output_dir` from the `PCATask` table and define its full path.
+        2. Load the `kpms_dj_config` file that contains the updated `video_dir` and bodyparts, \
+           and reload the keypoint coordinates and confidences scores from the source files to be used in the PCA fitting.
+        3. Fit the PCA model and save it as `pca.p` file in the output directory.
+        4. Insert the creation datetime as the `pca_fit_time` and the explained variance ratio of the PCA components into the table.
+        """
+        from keypoint_moseq import fit_pca, load_pca, save_pca
+
+        kpms_project_output_dir, task_mode = (PCATask & key).fetch1(
+            "kpms_project_output_dir", "task_mode"
+        )
+        kpms_project_output_dir = (
+            moseq_infer.get_kpms_processed_data_dir() / kpms_project_output_dir
+        )
+
+        if task_mode == "trigger":
+            kpms_default_config = load_kpms_dj_config_cached(
+                kpms_project_output_dir.as_posix(),
+                check_if_valid=True,
+                build_indexes=True,
+            )
+
+            # Reload keypoints from the source files rather than fetching the
+            # `coordinates`/`confidences` longblobs stored in `PCAPrep`, which for
+            # multi-hour videosets would move hundreds of MB through the database.
+            pose_estimation_method, kpset_dir = (KeypointSet & key).fetch1(
+                "pose_estimation_method", "kpset_dir"
+            )
+            kpset_dir = find_full_path(moseq_infer.get_kpms_root_data_dir(), kpset_dir)
+            coordinates, confidences, _ = _load_keypoints_cached(
+                kpset_dir.as_posix(), pose_estimation_method
+            )
+
+            data, _ = _format_data_cached(
+                kpms_default_config, coordinates, confidences, kpms_project_output_dir
+            )
+
+            pca = fit_pca(**data, **kpms_default_config)
+            save_pca(pca, kpms_project_output_dir.as_posix())
+            creation_datetime = datetime.now(timezone.utc)
+        else:
+            pca = load_pca(kpms_project_output_dir.as_posix())
+            creation_datetime = None
+
+        self.insert1(
+            dict(
+                **key,
+                pca_fit_time=creation_datetime,
+                explained_variance_ratio=np.asarray(
+                    pca.explained_variance_ratio_, dtype=np.float32
+                ),
+            )
+        )
+
+
+@schema
+class LatentDimension(dj.Imported):
+    """
+    Determine the latent dimension as part of the autoregressive hyperparameters (`ar_hypparams`) for the model fitting.
+    The objective of the analysis is to inform the user about the number of principal components needed to explain a
+    90% variance threshold. Subsequently, the decision on how many components to utilize for the model fitting is left
+    to the user.
+
+    Attributes:
+        PCAFit (foreign key)               : `PCAFit` Key.
+        variance_percentage (float)        : Variance threshold. Fixed value to 90%.
+        latent_dimension (smallint)        : Number of principal components required to explain the specified variance.
+        latent_dim_desc (varchar)          : Automated description of the computation result.
+    """
+
+    definition = """
+    -> PCAFit                                   # `PCAFit` Key
+    ---
+    variance_percentage      : float            # Variance threshold. Fixed value to 90 percent.
+    latent_dimension         : smallint unsigned # Number of principal components required to explain the specified variance.
+    latent_dim_desc          : varchar(1000)    # Automated description of the computation result.
+    """
+
+    def make(self, key):
+        """
+        Make function to compute and store the latent dimension that explains a 90% variance threshold.
+
+        Args:
+            key (dict): `PCAFit` Key.
+
+        Raises:
+
+        High-Level Logic:
+        1. Fetch the explained variance ratio of the PCA components stored in the `PCAFit` table.
+        2. Set a specified variance threshold to 90% and compute the cumulative sum of the explained variance ratio.
+        3. Determine the number of components required to explain the specified variance.
+            3.1 If the cumulative sum of the explained variance ratio is less than the specified variance threshold, \
+                it sets the `latent_dimension` to the total number of components and `variance_percentage` to the cumulative sum of the explained variance ratio.
+            3.2 If the cumulative sum of the explained variance ratio is greater than the specified variance threshold, \
+                it sets the `latent_dimension` to the number of components that explain the specified variance and `variance_percentage` to the specified variance threshold.
+        4. Insert the results of this `make` function into the table.
+        """
+        # Fetching the stored ratio vector avoids unpickling the full PCA
+        # model (components matrix, mean vector) from `pca.p`.
+        explained_variance_ratio = (PCAFit & key).fetch1("explained_variance_ratio")
+
+        variance_threshold = 0.90
+
+        cs = np.cumsum(
+            explained_variance_ratio
+        )  # explained_variance_ratio ndarray of shape (n_components,)
+
+        if cs.size == 0:
+            raise ValueError(
+                f"Empty explained variance ratio stored in `PCAFit` for {key}."
+            )
+
+        if cs[-1] < variance_threshold:
+            latent_dimension = len(cs)
+            variance_percentage = cs[-1] * 100
+            latent_dim_desc = f"All components together only explain {variance_percentage}% of variance."
+        else:
+            # `cs` is monotonically nondecreasing, so a binary search replaces
+            # the full boolean-mask scan.
+            latent_dimension = (
+                int(np.searchsorted(cs, variance_threshold, side="right")) + 1
+            )
+            variance_percentage = variance_threshold * 100
+            latent_dim_desc = f">={variance_threshold*100}% of variance explained by {latent_dimension} components."
+
+        self.insert1(
+            dict(
+                **key,
+                variance_percentage=variance_percentage,
+                latent_dimension=latent_dimension,
+                latent_dim_desc=latent_dim_desc,
+            )
+        )
+
+
+@schema
+class PreFitTask(dj.Lookup):
+    """Insert the parameters for the model (AR-HMM) pre-fitting.
+
+    Attributes:
+        PCAFit (foreign key)                : `PCAFit` task.
+        prefit_id (smallint unsigned)       : Unique ID for each pre-fitting task.
+        pre_latent_dim (int)                : Latent dimension to use for the model pre-fitting.
+        pre_kappa (int)                     : Kappa value to use for the model pre-fitting.
+        pre_num_iterations (int)            : Number of Gibbs sampling iterations to run in the model pre-fitting.
+        pre_fit_desc(varchar)               : User-defined description of the pre-fitting task.
+    """
+
+    definition = """
+    -> PCAFit                                           # `PCAFit` Key
+    prefit_id                    : smallint unsigned    # Unique ID for each pre-fitting task
+    ---
+    pre_latent_dim               : int                  # Latent dimension to use for the model pre-fitting
+    pre_kappa                    : int                  # Kappa value to use for the model pre-fitting
+    pre_num_iterations           : int                  # Number of Gibbs sampling iterations to run in the model pre-fitting
+    model_name                   : varchar(100)         # Name of the model to be loaded if `task_mode='load'`
+    task_mode='load'             :enum('trigger','load')# 'load': load computed analysis results, 'trigger': trigger computation
+    pre_fit_desc=''              : varchar(1000)        # User-defined description of the pre-fitting task
+    """
+
+
+@schema
+class PreFit(dj.Computed):
+    """Fit AR-HMM model.
+
+    Attributes:
+        PreFitTask (foreign key)                : `PreFitTask` Key.
+        model_name (varchar)                    : Name of the model as "kpms_project_output_dir/model_name".
+        pre_fit_duration (float)                : Time duration (seconds) of the model fitting computation.
+    """
+
+    definition = """
+    -> PreFitTask                               # `PreFitTask` Key
+    ---
+    model_name=''                : varchar(100) # Name of the model as "kpms_project_output_dir/model_name"
+    pre_fit_duration=NULL        : float        # Time duration (seconds) of the model fitting computation
+    """
+
+    def make(self, key):
+        """
+        Make function to fit the AR-HMM model using the latent trajectory defined by `model['states']['x'].
+
+        Args:
+            key (dict) : dictionary with the `PreFitTask` Key.
+
+        Raises:
+
+        High-level Logic:
+        1. Fetch the `kpms_project_output_dir` and define the full path.
+        2. Fetch the model parameters from the `PreFitTask` table.
+        3. Update the `dj_config.yml` with the latent dimension and kappa for the AR-HMM fitting.
+        4. Load the pca model from file in the `kpms_project_output_dir`.
+        5. Load the keypoint `coordinates` and `confidences` scores from the source files to format the data for the model initialization. \
+            # Data - contains the data for model fitting. \
+            # Metadata - contains the recordings and start/end frames for the data.
+        6. Initialize the model that create a `model` dict containing states, parameters, hyperparameters, noise prior, and random seed.
+        7. Update the model dict with the selected kappa for the AR-HMM fitting.
+        8. Fit the AR-HMM model using the `pre_num_iterations` and create a subdirectory in `kpms_project_output_dir` with the model's latest checkpoint file.
+        9. Calculate the duration of the model fitting computation and insert it in the `PreFit` table.
+        """
+        from keypoint_moseq import (
+            load_pca,
+            init_model,
+            update_hypparams,
+            fit_model,
+        )
+
+        kpms_processed = moseq_infer.get_kpms_processed_data_dir()
+
+        kpms_project_output_dir = find_full_path(
+            kpms_processed, (PCATask & key).fetch1("kpms_project_output_dir")
+        )
+
+        pre_latent_dim, pre_kappa, pre_num_iterations, task_mode, model_name = (
+            PreFitTask & key
+        ).fetch1(
+            "pre_latent_dim",
+            "pre_kappa",
+            "pre_num_iterations",
+            "task_mode",
+            "model_name",
+        )
+        if task_mode == "trigger":
+            kpms_dj_config = load_kpms_dj_config_cached(
+                kpms_project_output_dir.as_posix(),
+                check_if_valid=True,
+                build_indexes=True,
+            )
+
+            config_updates = dict(
+                latent_dim=int(pre_latent_dim), kappa=float(pre_kappa)
+            )
+            # rewrite the config only when the update actually changes it;
+            # `generate_kpms_dj_config` nests these under the hypparam sections
+            if (
+                kpms_dj_config["ar_hypparams"]["latent_dim"]
+                != config_updates["latent_dim"]
+                or kpms_dj_config["trans_hypparams"]["kappa"] != config_updates["kappa"]
+            ):
+                kpms_dj_config.update(config_updates)
+                generate_kpms_dj_config(
+                    kpms_project_output_dir.as_posix(), **kpms_dj_config
+                )
+
+            pca_path = kpms_project_output_dir / "pca.p"
+            if pca_path:
+                pca = load_pca(kpms_project_output_dir.as_posix())
+            else:
+                raise FileNotFoundError(
+                    f"No pca model (`pca.p`) found in the project directory {kpms_project_output_dir}"
+                )
+
+            pose_estimation_method, kpset_dir = (KeypointSet & key).fetch1(
+                "pose_estimation_method", "kpset_dir"
+            )
+            kpset_dir = find_full_path(moseq_infer.get_kpms_root_data_dir(), kpset_dir)
+            coordinates, confidences, _ = _load_keypoints_cached(
+                kpset_dir.as_posix(), pose_estimation_method
+            )
+            data, metadata = _format_data_cached(
+                kpms_dj_config, coordinates, confidences, kpms_project_output_dir
+            )
+
+            model = init_model(data=data, metadata=metadata, pca=pca, **kpms_dj_config)
+
+            model = update_hypparams(
+                model, kappa=float(pre_kappa), latent_dim=int(pre_latent_dim)
+            )
+
+            start_time = datetime.now()
+            model, model_name = fit_model(
+                model=model,
+                data=data,
+                metadata=metadata,
+                project_dir=kpms_project_output_dir.as_posix(),
+                ar_only=True,
+                num_iters=pre_num_iterations,
+            )
+            end_time = datetime.now()
+
+            duration_seconds = (end_time - start_time).total_seconds()
+        else:
+            duration_seconds = None
+
+        self.insert1(
+            {
+                **key,
+                "model_name": (
+                    kpms_project_output_dir.relative_to(kpms_processed) / model_name
+                ).as_posix(),
+                "pre_fit_duration": duration_seconds,
+            }
+        )
+
+
+@schema
+class FullFitTask(dj.Lookup):
+    """Insert the parameters for the full (Keypoint-SLDS model) fitting.
+       The full model will generally require a lower value of kappa to yield the same target syllable durations.
+
+    Attributes:
+        PCAFit (foreign key)                 : `PCAFit` Key.
+        fullfit_id (smallint unsigned)       : Unique ID for each full fitting task.
+        full_latent_dim (int)                : Latent dimension to use for the model full fitting.
+        full_kappa (int)                     : Kappa value to use for the model full fitting.
+        full_num_iterations (int)            : Number of Gibbs sampling iterations to run in the model full fitting.
+        full_fit_desc(varchar)               : User-defined description of the model full fitting task.
+
+    """
+
+    definition = """
+    -> PCAFit                                           # `PCAFit` Key
+    fullfit_id                   : smallint unsigned    # Unique ID for each full fitting task
+    ---
+    full_latent_dim              : int                  # Latent dimension to use for the model full fitting
+    full_kappa                   : int                  # Kappa value to use for the model full fitting
+    full_num_iterations          : int                  # Number of Gibbs sampling iterations to run in the model full fitting
+    model_name                   : varchar(100)         # Name of the model to be loaded if `task_mode='load'`
+    task_mode='load'             :enum('load','trigger')# Trigger or load the task
+    full_fit_desc=''             : varchar(1000)        # User-defined description of the model full fitting task   
+    """
+
+
+@schema
+class FullFit(dj.Computed):
+    """Fit the full (Keypoint-SLDS) model.
+
+    Attributes:
+        FullFitTask (foreign key)            : `FullFitTask` Key.
+        model_name                           : varchar(100) # Name of the model as "kpms_project_output_dir/model_name"
+        full_fit_duration (float)            : Time duration (seconds) of the full fitting computation
+    """
+
+    definition = """
+    -> FullFitTask                               # `FullFitTask` Key
+    ---
+    model_name                    : varchar(100) # Name of the model as "kpms_project_output_dir/model_name"
+    full_fit_duration=NULL        : float        # Time duration (seconds) of the full fitting computation 
+    """
+
+    def make(self, key):
+        """
+            Make function to fit the full (keypoint-SLDS) model
+
+            Args:
+                key (dict): dictionary with the `FullFitTask` Key.
+
+            Raises:
+
+            High-level Logic:
+            1. Fetch the `kpms_project_output_dir` and define the full path.
+            2. Fetch the model parameters from the `FullFitTask` table.
+            2. Update the `dj_config.yml` with the selected latent dimension and kappa for the full-fitting.
+            3. Initialize and fit the full model in a new `model_name` directory.
+            4. Load the pca model from file in the `kpms_project_output_dir`.
+            5. Load the keypoint `coordinates` and `confidences` scores from the source files to format the data for the model initialization.
+            6. Initialize the model that create a `model` dict containing states, parameters, hyperparameters, noise prior, and random seed.
+            7. Update the model dict with the selected kappa for the Keypoint-SLDS fitting.
+            8. Fit the Keypoint-SLDS model using the `full_num_iterations` and create a subdirectory in `kpms_project_output_dir` with the model's latest checkpoint file.
+            8. Reindex syllable labels by their frequency in the most recent model snapshot in the checkpoint file. \
+                This function permutes the states and parameters of a saved checkpoint so that syllables are labeled \
+                in order of frequency (i.e. so that 0 is the most frequent, 1 is the second most, and so on).
+            8. Calculate the duration of the model fitting computation and insert it in the `PreFit` table.
+        """
+        from keypoint_moseq import (
+            load_pca,
+            init_model,
+            update_hypparams,
+            fit_model,
+            reindex_syllables_in_checkpoint,
+        )
+
+        kpms_processed = moseq_infer.get_kpms_processed_data_dir()
+
+        kpms_project_output_dir = find_full_path(
+            kpms_processed, (PCATask & key).fetch1("kpms_project_output_dir")
+        )
+
+        full_latent_dim, full_kappa, full_num_iterations, task_mode, model_name = (
+            FullFitTask & key
+        ).fetch1(
+            "full_latent_dim",
+            "full_kappa",
+            "full_num_iterations",
+            "task_mode",
+            "model_name",
+        )
+        if task_mode == "trigger":
+            kpms_dj_config = load_kpms_dj_config_cached(
+                kpms_project_output_dir.as_posix(),
+                check_if_valid=True,
+                build_indexes=True,
+            )
+            config_updates = dict(
+                latent_dim=int(full_latent_dim), kappa=float(full_kappa)
+            )
+            # rewrite the config only when the update actually changes it;
+            # `generate_kpms_dj_config` nests these under the hypparam sections
+            if (
+                kpms_dj_config["ar_hypparams"]["latent_dim"]
+                != config_updates["latent_dim"]
+                or kpms_dj_config["trans_hypparams"]["kappa"] != config_updates["kappa"]
+            ):
+                kpms_dj_config.update(config_updates)
+                generate_kpms_dj_config(
+                    kpms_project_output_dir.as_posix(), **kpms_dj_config
+                )
+
+            pca_path = kpms_project_output_dir / "pca.p"
+            if pca_path:
+                pca = load_pca(kpms_project_output_dir.as_posix())
+            else:
+                raise FileNotFoundError(
+                    f"No pca model (`pca.p`) found in the project directory {kpms_project_output_dir}"
+                )
+
+            pose_estimation_method, kpset_dir = (KeypointSet & key).fetch1(
+                "pose_estimation_method", "kpset_dir"
+            )
+            kpset_dir = find_full_path(moseq_infer.get_kpms_root_data_dir(), kpset_dir)
+            coordinates, confidences, _ = _load_keypoints_cached(
+                kpset_dir.as_posix(), pose_estimation_method
+            )
+            data, metadata = _format_data_cached(
+                kpms_dj_config, coordinates, confidences, kpms_project_output_dir
+            )
+            model = init_model(data=data, metadata=metadata, pca=pca, **kpms_dj_config)
+            model = update_hypparams(
+                model, kappa=float(full_kappa), latent_dim=int(full_latent_dim)
+            )
+
+            start_time = datetime.now(timezone.utc)
+            model, model_name = fit_model(
+                model=model,
+                data=data,
+                metadata=metadata,
+                project_dir=kpms_project_output_dir.as_posix(),
+                ar_only=False,
+                num_iters=full_num_iterations,
+            )
+            end_time = datetime.now(timezone.utc)
+            duration_seconds = (end_time - start_time).total_seconds()
+
+            reindex_syllables_in_checkpoint(
+                kpms_project_output_dir.as_posix(), Path(model_name).parts[-1]
+            )
+        else:
+            duration_seconds = None
+
+        self.insert1(
+            {
+                **key,
+                "model_name": (
+                    kpms_project_output_dir.relative_to(kpms_processed) / model_name
+                ).as_posix(),
+                "full_fit_duration": duration_seconds,
+            }
+        )
@@ -1,11 +1,163 @@
+import hashlib
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from glob import glob
+from pathlib import Path
+
+import numpy as np
 import yaml
-import jax.numpy as jnp
 
 logger = logging.getLogger("datajoint")
 
 
+def _astype_float32(arrays):
+    """Cast each array in a name->array dict to float32, copying only if needed.
+
+    Keypoint noise (pixels) bounds model accuracy far above FP32 resolution,
+    so single precision halves blob storage and memory bandwidth for every
+    downstream consumer.
+    """
+    return {k: v.astype(np.float32, copy=False) for k, v in arrays.items()}
+
+
+def load_keypoints_parallel(filepath_pattern, format="deeplabcut", max_workers=8):
+    """Parallel counterpart of the `load_keypoints` function from the `keypoint_moseq`
+    package for DeepLabCut results.
+
+    `keypoint_moseq.load_keypoints` reads each keypoint file serially. DeepLabCut
+    `.h5`/`.csv` results are independent files and HDF5 releases the GIL during
+    I/O, so the per-file reads are dispatched through a thread pool and merged
+    into the same `(coordinates, confidences, bodyparts)` structures returned by
+    the serial loader. Other formats fall back to the serial loader.
+
+    Args:
+        filepath_pattern (str, Path or list): Directory, glob pattern, or list of paths to the keypoint files.
+        format (str): default=`deeplabcut`. Pose estimation method used to obtain the keypoints data.
+        max_workers (int): default=8. Maximum number of reader threads.
+
+    Returns:
+        coordinates (dict): Dictionary mapping recording names to keypoint coordinates as float32 ndarrays of shape (n_frames, n_bodyparts, 2).
+        confidences (dict): Dictionary mapping recording names to `likelihood` scores as float32 ndarrays of shape (n_frames, n_bodyparts).
+        bodyparts (list): List of bodypart names. The order matches the order of the bodyparts in `coordinates` and `confidences`.
+    """
+
+    if format != "deeplabcut":
+        from keypoint_moseq import load_keypoints
+
+        coordinates, confidences, bodyparts = load_keypoints(
+            filepath_pattern=filepath_pattern, format=format
+        )
+        return _astype_float32(coordinates), _astype_float32(confidences), bodyparts
+
+    import pandas as pd
+
+    patterns = (
+        filepath_pattern
+        if isinstance(filepath_pattern, (list, tuple))
+        else [filepath_pattern]
+    )
+    extensions = (".csv", ".h5", ".hdf5")
+
+    filepaths = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            # one scandir syscall per directory; globbing each pattern would
+            # rescan the directory once per entry
+            with os.scandir(path) as entries:
+                filepaths.extend(
+                    path / name
+                    for name in sorted(entry.name for entry in entries)
+                    if os.path.splitext(name)[1] in extensions
+                )
+        else:
+            filepaths.extend(
+                Path(fp)
+                for fp in sorted(glob(str(pattern)))
+                if Path(fp).suffix in extensions
+            )
+
+    if not filepaths:
+        raise FileNotFoundError(
+            f"No deeplabcut keypoint files found for {filepath_pattern}"
+        )
+
+    # The parsed arrays are a pure function of the source files, so they are
+    # cached on disk keyed by the file list and modification times; cache hits
+    # skip the per-file parse entirely.
+    digest = hashlib.blake2b(digest_size=16)
+    for filepath in filepaths:
+        digest.update(f"{filepath}:{os.path.getmtime(filepath)}".encode())
+    cache_path = filepaths[0].parent / "_kp_cache" / f"{digest.hexdigest()}.npz"
+
+    if cache_path.exists():
+        with np.load(cache_path) as npz:
+            coordinates = {
+                name[len("coordinates/") :]: npz[name]
+                for name in npz.files
+                if name.startswith("coordinates/")
+            }
+            confidences = {
+                name[len("confidences/") :]: npz[name]
+                for name in npz.files
+                if name.startswith("confidences/")
+            }
+            bodyparts = [str(bodypart) for bodypart in npz["bodyparts"]]
+        # no-op for caches written as float32; upgrades pre-existing float64 ones
+        return _astype_float32(coordinates), _astype_float32(confidences), bodyparts
+
+    def _read(filepath):
+        if filepath.suffix == ".csv":
+            df = pd.read_csv(filepath, header=[0, 1, 2], index_col=0)
+        else:
+            df = pd.read_hdf(filepath)
+        if "individuals" in df.columns.names:
+            return None  # multi-animal file; needs the per-individual split
+        arr = df.to_numpy(dtype=np.float32).reshape(len(df), -1, 3)
+        bodyparts = list(dict.fromkeys(df.columns.get_level_values("bodyparts")))
+        return filepath.stem, arr, bodyparts
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(filepaths))) as executor:
+        results = list(executor.map(_read, filepaths))
+
+    if any(result is None for result in results):
+        # multi-animal results carry an `individuals` column level and must be
+        # split per individual, which only the serial loader implements
+        from keypoint_moseq import load_keypoints
+
+        coordinates, confidences, bodyparts = load_keypoints(
+            filepath_pattern=filepath_pattern, format=format
+        )
+        return _astype_float32(coordinates), _astype_float32(confidences), bodyparts
+
+    coordinates = {name: arr[:, :, :2] for name, arr, _ in results}
+    confidences = {name: arr[:, :, 2] for name, arr, _ in results}
+    bodyparts = results[0][2]
+    for name, _, file_bodyparts in results[1:]:
+        if file_bodyparts != bodyparts:
+            raise ValueError(
+                f"Bodyparts in `{name}` do not match those in `{results[0][0]}`: "
+                f"{file_bodyparts} vs. {bodyparts}"
+            )
+
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        np.savez(
+            cache_path,
+            bodyparts=np.asarray(bodyparts),
+            **{f"coordinates/{name}": arr for name, arr in coordinates.items()},
+            **{f"confidences/{name}": arr for name, arr in confidences.items()},
+        )
+    except OSError as e:
+        # the keypoint directory may live on a read-only or shared mount;
+        # skipping the cache only costs a re-parse on the next load
+        logger.warning(f"Could not write keypoint cache {cache_path}: {e}")
+
+    return coordinates, confidences, bodyparts
+
+
 def generate_kpms_dj_config(output_dir, **kwargs):
     """This function mirrors the behavior of the `generate_config` function from the `keypoint_moseq`
     package. Nonetheless, it produces a duplicate of the initial configuration file, titled
@@ -156,6 +308,7 @@ def load_kpms_dj_config(output_dir, check_if_valid=True, build_indexes=True):
         kpms_dj_config (dict): configuration settings
     """
 
+    import jax.numpy as jnp
     from keypoint_moseq import check_config_validity
 
     config_path = os.path.join(output_dir, "kpms_dj_config.yml")
@@ -184,3 +337,31 @@ def load_kpms_dj_config(output_dir, check_if_valid=True, build_indexes=True):
         kpms_dj_config["skeleton"] = []
 
     return kpms_dj_config
+
+
+@lru_cache(maxsize=64)
+def _load_kpms_dj_config_cached(output_dir, mtime, check_if_valid, build_indexes):
+    return load_kpms_dj_config(
+        output_dir, check_if_valid=check_if_valid, build_indexes=build_indexes
+    )
+
+
+def load_kpms_dj_config_cached(output_dir, check_if_valid=True, build_indexes=True):
+    """Memoized variant of :py:func:`load_kpms_dj_config`.
+
+    The cache is keyed on the modification time of the `kpms_dj_config.yml`
+    file, so repeated loads of an unchanged config skip the YAML parse and
+    validation while any rewrite invalidates the entry automatically.
+
+    Args:
+        output_dir (str): Directory containing the `kpms_dj_config.yml` that will be loaded.
+        check_if_valid (bool): default=True. Check if the config is valid.
+        build_indexes (bool): default=True. Add keys `"anterior_idxs"` and `"posterior_idxs"` to the config.
+
+    Returns:
+        kpms_dj_config (dict): configuration settings (a copy safe for caller mutation).
+    """
+    mtime = os.path.getmtime(os.path.join(output_dir, "kpms_dj_config.yml"))
+    return dict(
+        _load_kpms_dj_config_cached(output_dir, mtime, check_if_valid, build_indexes)
+    )